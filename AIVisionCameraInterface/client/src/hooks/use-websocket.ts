@@ -44,7 +44,8 @@ export function useWebSocket() {
             
           case "performance_metrics":
           case "performance_update":
-            setPerformanceMetrics(message.metrics || message);
+            // performance_update only carries fields that changed
+            setPerformanceMetrics(prev => ({ ...prev, ...(message.metrics || message) }));
             break;
             
           case "model_uploaded":
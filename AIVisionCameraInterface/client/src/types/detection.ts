@@ -18,6 +18,10 @@ export interface PerformanceMetrics {
   total_detections?: number;
   captured_images?: number;
   model_name?: string;
+  process_rss_mb?: number;
+  process_threads?: number;
+  process_cpu_usage?: number;
+  worker_processes?: number;
 }
 
 export interface SessionStatus {
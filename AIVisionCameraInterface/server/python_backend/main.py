@@ -1,4 +1,5 @@
 import asyncio
+import hmac
 import json
 import os
 import time
@@ -7,15 +8,16 @@ import aiofiles
 import cv2
 import numpy as np
 import psutil
-from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
 import uvicorn
 from pathlib import Path
 
 from models.yolo_detector import YOLODetector
 from services.websocket_manager import WebSocketManager
 from services.performance_monitor import PerformanceMonitor
+from services.frame_profiler import FrameProfiler
 from utils.file_handler import FileHandler
 
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -50,7 +52,15 @@ app.add_middleware(
 
 # Initialize services
 websocket_manager = WebSocketManager()
-performance_monitor = PerformanceMonitor()
+def read_sample_interval() -> float:
+    """Parse PERFORMANCE_SAMPLE_INTERVAL (seconds between metric samples)"""
+    value = os.getenv("PERFORMANCE_SAMPLE_INTERVAL", "1.0")
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"PERFORMANCE_SAMPLE_INTERVAL must be a number of seconds, got {value!r}") from None
+
+performance_monitor = PerformanceMonitor(sample_interval=read_sample_interval())
 file_handler = FileHandler()
 yolo_detector: Optional[YOLODetector] = None
 
@@ -62,6 +72,12 @@ EXPORTS_DIR = Path("exports")
 for directory in [UPLOAD_DIR, MODELS_DIR, EXPORTS_DIR]:
     directory.mkdir(exist_ok=True)
 
+frame_profiler = FrameProfiler(EXPORTS_DIR)
+
+# Shared secret for /api/admin endpoints (sent as X-Admin-Token); they are
+# disabled when it is not set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # Global state
 current_session = {
     "start_time": None,
@@ -188,6 +204,66 @@ async def export_data(format: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export data: {str(e)}")
 
+def check_admin_token(token: Optional[str]):
+    """Reject admin requests unless ADMIN_TOKEN is configured and matches"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/api/admin/profiling/start")
+async def start_profiling(config: dict, x_admin_token: Optional[str] = Header(None)):
+    """Profile process_frame for the next N frames and/or T seconds"""
+    check_admin_token(x_admin_token)
+    
+    try:
+        frames = config.get("frames")
+        seconds = config.get("seconds")
+        status = frame_profiler.start(
+            mode=config.get("mode", "cprofile"),
+            frames=int(frames) if frames is not None else None,
+            seconds=float(seconds) if seconds is not None else None,
+            trace_memory=bool(config.get("trace_memory", False))
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return JSONResponse(content={"message": "Profiling started", "status": status})
+
+@app.post("/api/admin/profiling/stop")
+async def stop_profiling(x_admin_token: Optional[str] = Header(None)):
+    """Finish the running profiling capture early"""
+    check_admin_token(x_admin_token)
+    
+    result = await frame_profiler.stop()
+    if result is None:
+        raise HTTPException(status_code=404, detail="No profiling capture available")
+    
+    return JSONResponse(content=result)
+
+@app.get("/api/admin/profiling")
+async def get_profiling(x_admin_token: Optional[str] = Header(None)):
+    """Get profiling status and the summary of the last capture"""
+    check_admin_token(x_admin_token)
+    
+    return JSONResponse(content={
+        "status": frame_profiler.status(),
+        "result": frame_profiler.last_result
+    })
+
+@app.get("/api/admin/profiling/download/{kind}")
+async def download_profile(kind: str, x_admin_token: Optional[str] = Header(None)):
+    """Download an artifact of the last capture (pstats/collapsed/summary)"""
+    check_admin_token(x_admin_token)
+    
+    file_path = frame_profiler.get_result_file(kind)
+    if not file_path or not file_handler.file_exists(file_path):
+        raise HTTPException(status_code=404, detail=f"No '{kind}' profile available")
+    
+    return FileResponse(file_path, filename=Path(file_path).name, media_type="application/octet-stream")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time communication"""
@@ -203,6 +279,9 @@ async def websocket_endpoint(websocket: WebSocket):
             "model_name": current_session.get("model_name")
         })
         
+        # Full metrics once; periodic updates only carry changed fields
+        await send_performance_metrics(websocket)
+        
         while True:
             # Receive data from client
             data = await websocket.receive_json()
@@ -230,24 +309,28 @@ async def process_frame(websocket: WebSocket, frame_data: str):
     
     try:
         # Decode base64 frame
-        import base64
-        frame_bytes = base64.b64decode(frame_data.split(',')[1])
-        nparr = np.frombuffer(frame_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with frame_profiler.stage("decode"):
+            import base64
+            frame_bytes = base64.b64decode(frame_data.split(',')[1])
+            nparr = np.frombuffer(frame_bytes, np.uint8)
+            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         # Measure inference time
         start_time = time.time()
-        detections = yolo_detector.detect(frame)
+        with frame_profiler.stage("inference"):
+            detections = yolo_detector.detect(frame)
         inference_time = (time.time() - start_time) * 1000  # Convert to ms
+        performance_monitor.record_frame()
         
-        # Update session statistics
-        current_session["total_detections"] += len(detections)
-        current_session["performance_metrics"]["inference_time"] = inference_time
-        
-        # Store detections
-        for detection in detections:
-            detection["timestamp"] = time.time()
-            current_session["detections"].append(detection)
+        with frame_profiler.stage("post_processing"):
+            # Update session statistics
+            current_session["total_detections"] += len(detections)
+            current_session["performance_metrics"]["inference_time"] = inference_time
+            
+            # Store detections
+            for detection in detections:
+                detection["timestamp"] = time.time()
+                current_session["detections"].append(detection)
         
         # Send results
         await websocket.send_json({
@@ -262,6 +345,9 @@ async def process_frame(websocket: WebSocket, frame_data: str):
             "type": "error",
             "message": f"Failed to process frame: {str(e)}"
         })
+    finally:
+        # Failed frames count too, so frame-limited captures still finish
+        frame_profiler.frame_done()
 
 async def capture_image(websocket: WebSocket, frame_data: str):
     """Capture and save an image with detection metadata"""
@@ -320,27 +406,32 @@ async def send_performance_metrics(websocket: WebSocket):
 
 # Background task to broadcast performance metrics
 async def performance_broadcast():
-    """Broadcast performance metrics periodically"""
+    """Broadcast changed performance metrics periodically"""
+    last_broadcast: Dict = {}
     while True:
         if websocket_manager.active_connections:
             try:
-                metrics = performance_monitor.get_current_metrics()
+                metrics = performance_monitor.get_snapshot()
                 current_session["performance_metrics"].update(metrics)
                 
-                await websocket_manager.broadcast_message({
-                    "type": "performance_update",
-                    "metrics": metrics
-                })
+                changed = performance_monitor.get_changed_metrics(last_broadcast, metrics)
+                if changed:
+                    last_broadcast.update(changed)
+                    await websocket_manager.broadcast_message({
+                        "type": "performance_update",
+                        "metrics": changed
+                    })
             except Exception as e:
                 print(f"Error broadcasting performance metrics: {e}")
         
-        await asyncio.sleep(1)  # Broadcast every second
+        await asyncio.sleep(performance_monitor.sample_interval)
 
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks & load default model if available"""
     global yolo_detector
     
+    performance_monitor.start()
     asyncio.create_task(performance_broadcast())
 
     default_model_path = MODELS_DIR / "best.pt"
@@ -355,6 +446,12 @@ async def startup_event():
     else:
         print("[STARTUP] No default model found at 'models/b'")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background samplers"""
+    performance_monitor.stop()
+    await frame_profiler.stop()
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
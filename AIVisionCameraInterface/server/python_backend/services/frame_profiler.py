@@ -0,0 +1,373 @@
+import asyncio
+import concurrent.futures
+import cProfile
+import json
+import math
+import os
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+PROFILING_MODES = ("cprofile", "sampling")
+
+# Hard limit for any capture, so one never outlives a burst of traffic
+MAX_CAPTURE_SECONDS = 300
+
+# Artifacts of the most recent capture; each capture overwrites the last one
+ARTIFACT_NAMES = {
+    "pstats": "profile.pstats",
+    "collapsed": "profile.collapsed",
+    "summary": "profile.json",
+}
+
+# Returned by stage() while no capture is running, so the hot path only pays
+# for one attribute check
+_DISABLED = nullcontext()
+
+# Allocations made by the import machinery, thread pools or the profiler
+# itself are noise
+_ALLOCATION_FILTERS = [
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, threading.__file__),
+    tracemalloc.Filter(False, queue.__file__),
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(concurrent.futures.__file__), "*")),
+    tracemalloc.Filter(False, __file__),
+]
+
+class FrameProfiler:
+    def __init__(self, output_dir: Path, sample_interval: float = 0.005, top_n: int = 25):
+        self.output_dir = Path(output_dir)
+        self.sample_interval = sample_interval
+        self.top_n = top_n
+
+        self.active = False
+        self.mode: Optional[str] = None
+        self.trace_memory = False
+        self.max_frames: Optional[int] = None
+        self.deadline: Optional[float] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+
+        self._started_at = 0.0
+        self._frames_captured = 0
+        self._stage_stats: Dict[str, Dict[str, float]] = {}
+        self._profile: Optional[cProfile.Profile] = None
+        self._started_tracemalloc = False
+        self._baseline_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._deadline_handle: Optional[asyncio.TimerHandle] = None
+        self._stop_task: Optional[asyncio.Task] = None
+        self._finalizing = False
+
+        # Sampling mode state, shared with the sampler thread
+        self._current_stage: Optional[str] = None
+        self._target_thread_id: Optional[int] = None
+        self._stacks: Counter = Counter()
+        self._stack_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler_thread: Optional[threading.Thread] = None
+
+    def start(self, mode: str = "cprofile", frames: Optional[int] = None,
+              seconds: Optional[float] = None, trace_memory: bool = False) -> Dict[str, Any]:
+        """Begin capturing the next N frames and/or T seconds of frame processing.
+
+        Must be called from the event loop that runs process_frame.
+        """
+        if self.active:
+            raise RuntimeError("A profiling capture is already running")
+        if self._finalizing:
+            raise RuntimeError("The previous profiling capture is still being written")
+        if mode not in PROFILING_MODES:
+            raise ValueError(f"Unsupported profiling mode '{mode}'. Use one of: {', '.join(PROFILING_MODES)}")
+        if frames is not None and frames <= 0:
+            raise ValueError("frames must be a positive integer")
+        if seconds is not None and (not math.isfinite(seconds) or seconds <= 0):
+            raise ValueError("seconds must be a positive finite number")
+        if frames is None and seconds is None:
+            frames = 100
+
+        loop = asyncio.get_running_loop()
+        # Every capture ends on time, even if no frames arrive
+        limit = min(seconds or MAX_CAPTURE_SECONDS, MAX_CAPTURE_SECONDS)
+
+        # Acquire everything that can fail before touching any state
+        profile = cProfile.Profile() if mode == "cprofile" else None
+        started_tracemalloc = False
+        baseline_snapshot = None
+        sampler_thread = None
+        try:
+            if trace_memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    started_tracemalloc = True
+                baseline_snapshot = tracemalloc.take_snapshot()
+            if mode == "sampling":
+                self._stacks = Counter()
+                self._stop_event.clear()
+                sampler_thread = threading.Thread(target=self._sample_loop, name="frame-profiler", daemon=True)
+                sampler_thread.start()
+        except Exception:
+            self._stop_event.set()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            raise
+
+        self.mode = mode
+        self.trace_memory = trace_memory
+        self.max_frames = frames
+        self._started_at = time.time()
+        self.deadline = self._started_at + limit
+        self._frames_captured = 0
+        self._stage_stats = {}
+        self._profile = profile
+        self._sampler_thread = sampler_thread
+        self._started_tracemalloc = started_tracemalloc
+        self._baseline_snapshot = baseline_snapshot
+        self._deadline_handle = loop.call_later(limit, self._schedule_stop)
+
+        self.active = True
+        return self.status()
+
+    def stage(self, name: str):
+        """Context manager timing one stage of process_frame while a capture runs"""
+        if not self.active:
+            return _DISABLED
+        return self._profile_stage(name)
+
+    @contextmanager
+    def _profile_stage(self, name: str):
+        memory_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        self._target_thread_id = threading.get_ident()
+        self._current_stage = name
+        if self._profile:
+            self._profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if self._profile:
+                self._profile.disable()
+            self._current_stage = None
+
+            stats = self._stage_stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "memory_delta_kb": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if self.trace_memory:
+                stats["memory_delta_kb"] += (tracemalloc.get_traced_memory()[0] - memory_before) / 1024
+
+    def frame_done(self):
+        """Count a profiled frame and finish the capture once its limit is reached"""
+        if not self.active:
+            return
+        self._frames_captured += 1
+        if self.max_frames is not None and self._frames_captured >= self.max_frames:
+            self._schedule_stop()
+
+    def _schedule_stop(self):
+        """Finish the capture in the background without blocking the caller"""
+        capture = self._end_capture()
+        if capture is not None:
+            self._stop_task = asyncio.get_running_loop().create_task(self._finalize_async(capture))
+
+    async def stop(self) -> Optional[Dict[str, Any]]:
+        """Finish the running capture, write its artifacts and return the summary"""
+        capture = self._end_capture()
+        if capture is not None:
+            await self._finalize_async(capture)
+        elif self._stop_task and not self._stop_task.done():
+            await self._stop_task
+        return self.last_result
+
+    async def _finalize_async(self, capture: Dict[str, Any]):
+        # Dumping stats, snapshots and files is slow; keep it off the event loop
+        try:
+            await asyncio.to_thread(self._finalize, capture)
+        finally:
+            self._finalizing = False
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.sample_interval):
+            stage = self._current_stage
+            thread_id = self._target_thread_id
+            if stage is None or thread_id is None:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(stage)
+            stack.reverse()
+            with self._stack_lock:
+                self._stacks[";".join(stack)] += 1
+
+    def _end_capture(self) -> Optional[Dict[str, Any]]:
+        """Switch profiling off and hand the collected state over for finalisation"""
+        if not self.active:
+            return None
+        self.active = False
+        self._finalizing = True
+        if self._deadline_handle:
+            self._deadline_handle.cancel()
+            self._deadline_handle = None
+        self._stop_event.set()
+
+        # Snapshot now, before finalisation threads or later frames allocate
+        end_snapshot = None
+        if self.trace_memory and self._baseline_snapshot is not None:
+            end_snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        capture = {
+            "mode": self.mode,
+            "trace_memory": self.trace_memory,
+            "frames_captured": self._frames_captured,
+            "duration": time.time() - self._started_at,
+            "stage_stats": self._stage_stats,
+            "profile": self._profile,
+            "sampler_thread": self._sampler_thread,
+            "baseline_snapshot": self._baseline_snapshot,
+            "end_snapshot": end_snapshot,
+        }
+        self._profile = None
+        self._sampler_thread = None
+        self._baseline_snapshot = None
+        self._started_tracemalloc = False
+        return capture
+
+    def _finalize(self, capture: Dict[str, Any]):
+        try:
+            self.last_result = self._write_result(capture)
+        except Exception as e:
+            print(f"Error finishing profiling capture: {e}")
+            self.last_result = None
+
+    def _write_result(self, capture: Dict[str, Any]) -> Dict[str, Any]:
+        self._remove_previous_artifacts()
+        files = {}
+
+        result: Dict[str, Any] = {
+            "mode": capture["mode"],
+            # Stage timings and cProfile times are inflated when this is on
+            "trace_memory": capture["trace_memory"],
+            "frames_captured": capture["frames_captured"],
+            "duration": round(capture["duration"], 3),
+            "stages": self._summarize_stages(capture["stage_stats"], capture["trace_memory"]),
+        }
+
+        if capture["mode"] == "cprofile":
+            profile = capture["profile"]
+            pstats_path = self.output_dir / ARTIFACT_NAMES["pstats"]
+            profile.dump_stats(str(pstats_path))
+            files["pstats"] = str(pstats_path)
+            result["top_functions"] = self._summarize_profile(profile)
+        else:
+            sampler_thread = capture["sampler_thread"]
+            if sampler_thread:
+                sampler_thread.join(timeout=1.0)
+            with self._stack_lock:
+                stacks = dict(self._stacks)
+            collapsed_path = self.output_dir / ARTIFACT_NAMES["collapsed"]
+            with open(collapsed_path, "w") as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+            files["collapsed"] = str(collapsed_path)
+            result["samples"] = sum(stacks.values())
+            result["top_stacks"] = [
+                {"stack": stack, "samples": count}
+                for stack, count in Counter(stacks).most_common(self.top_n)
+            ]
+
+        if capture["end_snapshot"] is not None:
+            result["top_allocations"] = self._summarize_allocations(
+                capture["end_snapshot"], capture["baseline_snapshot"]
+            )
+
+        summary_path = self.output_dir / ARTIFACT_NAMES["summary"]
+        files["summary"] = str(summary_path)
+        result["files"] = files
+        with open(summary_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+        return result
+
+    def _remove_previous_artifacts(self):
+        for name in ARTIFACT_NAMES.values():
+            path = self.output_dir / name
+            if path.exists():
+                path.unlink()
+
+    def _summarize_stages(self, stage_stats: Dict[str, Dict[str, float]], trace_memory: bool) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for name, stats in stage_stats.items():
+            summary[name] = {
+                "count": stats["count"],
+                "total_ms": round(stats["total_ms"], 3),
+                "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                "max_ms": round(stats["max_ms"], 3),
+            }
+            if trace_memory:
+                summary[name]["memory_delta_kb"] = round(stats["memory_delta_kb"], 1)
+        return summary
+
+    def _summarize_profile(self, profile: cProfile.Profile) -> List[Dict[str, Any]]:
+        # pstats.Stats refuses a profile that recorded no calls
+        profile.create_stats()
+        stats = profile.stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": f"{func} ({Path(filename).name}:{line})",
+                "calls": calls,
+                "total_time_ms": round(total_time * 1000, 3),
+                "cumulative_time_ms": round(cumulative_time * 1000, 3),
+            }
+            for (filename, line, func), (_, calls, total_time, cumulative_time, _) in ranked[:self.top_n]
+        ]
+
+    def _summarize_allocations(self, snapshot: tracemalloc.Snapshot,
+                               baseline: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+        """Allocation sites that grew between the start and the end of the capture"""
+        snapshot = snapshot.filter_traces(_ALLOCATION_FILTERS)
+        baseline = baseline.filter_traces(_ALLOCATION_FILTERS)
+        growth = [stat for stat in snapshot.compare_to(baseline, "lineno") if stat.size_diff > 0]
+        return [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff,
+            }
+            for stat in growth[:self.top_n]
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        """Describe the running capture, if any"""
+        return {
+            "active": self.active,
+            "mode": self.mode,
+            "trace_memory": self.trace_memory,
+            "frames_captured": self._frames_captured,
+            "max_frames": self.max_frames,
+            "seconds_remaining": round(max(self.deadline - time.time(), 0), 1) if self.active and self.deadline else None,
+            "has_result": self.last_result is not None,
+        }
+
+    def get_result_file(self, kind: str) -> Optional[str]:
+        """Path of an artifact ('pstats', 'collapsed' or 'summary') from the last capture"""
+        if not self.last_result:
+            return None
+        return self.last_result["files"].get(kind)
@@ -1,54 +1,194 @@
+import math
+import os
 import psutil
+import threading
 import time
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional
+
+# Minimum change per field before it is included in a delta broadcast.
+# Fields not listed here are compared for exact equality.
+DEFAULT_CHANGE_THRESHOLDS = {
+    "cpu_usage": 1.0,
+    "memory_usage_percent": 0.5,
+    "memory_usage_gb": 0.01,
+    "gpu_usage": 1.0,
+    "fps": 0.5,
+    "uptime": 10.0,
+    "process_cpu_usage": 1.0,
+    "process_rss_mb": 1.0,
+}
 
 class PerformanceMonitor:
-    def __init__(self):
+    def __init__(self, sample_interval: float = 1.0, change_thresholds: Optional[Dict[str, float]] = None):
+        if not math.isfinite(sample_interval) or sample_interval <= 0:
+            raise ValueError(f"sample_interval must be a positive number of seconds, got {sample_interval!r}")
         self.start_time = time.time()
+        self.sample_interval = sample_interval
+        self.change_thresholds = dict(DEFAULT_CHANGE_THRESHOLDS)
+        if change_thresholds:
+            self.change_thresholds.update(change_thresholds)
+
         self.frame_count = 0
         self.last_fps_update = time.time()
         self.fps = 0.0
+        self._frame_lock = threading.Lock()
 
-    def get_current_metrics(self) -> Dict[str, Any]:
-        """Get current system performance metrics"""
+        self._process = psutil.Process(os.getpid())
+        # Child processes are kept across samples: cpu_percent(interval=None)
+        # measures since the previous call on the same Process object
+        self._children: Dict[int, psutil.Process] = {}
+        self._gpu_module = None
+        self._snapshot: Mapping[str, Any] = MappingProxyType({})
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _load_gpu_module():
+        """Import GPUtil once; GPU metrics are skipped if it is unavailable"""
+        try:
+            import GPUtil
+            return GPUtil
+        except ImportError:
+            # GPUtil not available, GPU metrics not supported
+            return None
+
+    def start(self):
+        """Start the background sampler thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._gpu_module = self._load_gpu_module()
+        # Take one sample up front so readers never see an empty snapshot
+        self._sample()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="performance-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background sampler thread"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.sample_interval + 1.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.sample_interval):
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"Error sampling performance metrics: {e}")
+
+    def _get_gpu_usage(self) -> float:
+        if self._gpu_module is None:
+            return 0
+        try:
+            gpus = self._gpu_module.getGPUs()
+            if gpus:
+                return gpus[0].load * 100
+        except Exception:
+            # nvidia-smi missing or failing; report no GPU load
+            pass
+        return 0
+
+    def _get_process_metrics(self) -> Dict[str, Any]:
+        """RSS, threads and CPU of this server process and its worker children"""
+        try:
+            current_children = self._process.children(recursive=True)
+        except psutil.Error:
+            current_children = []
+
+        children = {}
+        for child in current_children:
+            # Reuse the cached object so its CPU counter keeps its baseline
+            children[child.pid] = self._children.get(child.pid, child)
+        self._children = children
+        processes = [self._process, *children.values()]
+
+        rss = 0
+        threads = 0
+        cpu = 0.0
+        for proc in processes:
+            try:
+                with proc.oneshot():
+                    rss += proc.memory_info().rss
+                    threads += proc.num_threads()
+                    cpu += proc.cpu_percent(interval=None)
+            except psutil.Error:
+                # Worker exited between listing and probing
+                continue
+
+        return {
+            "process_rss_mb": round(rss / (1024**2), 1),
+            "process_threads": threads,
+            "process_cpu_usage": round(cpu, 1),
+            "worker_processes": len(processes) - 1,
+        }
+
+    def _sample(self):
+        """Probe the system once and publish a new immutable snapshot"""
         # CPU usage
         cpu_percent = psutil.cpu_percent(interval=None)
-        
+
         # Memory usage
         memory = psutil.virtual_memory()
         memory_percent = memory.percent
         memory_used_gb = memory.used / (1024**3)
-        
+
         # GPU usage (if available)
-        gpu_percent = 0
-        try:
-            import GPUtil
-            gpus = GPUtil.getGPUs()
-            if gpus:
-                gpu_percent = gpus[0].load * 100
-        except ImportError:
-            # GPUtil not available, GPU metrics not supported
-            pass
-        
-        # Calculate FPS
+        gpu_percent = self._get_gpu_usage()
+
+        # Calculate FPS from frames recorded since the last update
         current_time = time.time()
-        self.frame_count += 1
-        
-        if current_time - self.last_fps_update >= 1.0:
-            self.fps = self.frame_count / (current_time - self.last_fps_update)
-            self.frame_count = 0
-            self.last_fps_update = current_time
-        
-        return {
+        with self._frame_lock:
+            elapsed = current_time - self.last_fps_update
+            if elapsed >= 1.0:
+                self.fps = self.frame_count / elapsed
+                self.frame_count = 0
+                self.last_fps_update = current_time
+            fps = self.fps
+
+        snapshot = {
             "cpu_usage": round(cpu_percent, 1),
-            "memory_usage_percent": round(memory_percent, 1), 
+            "memory_usage_percent": round(memory_percent, 1),
             "memory_usage_gb": round(memory_used_gb, 2),
             "gpu_usage": round(gpu_percent, 1),
-            "fps": round(self.fps, 1),
-            "uptime": round(current_time - self.start_time, 1)
+            "fps": round(fps, 1),
+            "uptime": round(current_time - self.start_time, 1),
+            **self._get_process_metrics(),
         }
+        self._snapshot = MappingProxyType(snapshot)
+
+    def record_frame(self):
+        """Count a processed frame towards the FPS metric"""
+        with self._frame_lock:
+            self.frame_count += 1
+
+    def get_snapshot(self) -> Mapping[str, Any]:
+        """Get the latest read-only metrics snapshot without probing the system"""
+        return self._snapshot
+
+    def get_current_metrics(self) -> Dict[str, Any]:
+        """Get current system performance metrics from the latest sample"""
+        return dict(self._snapshot)
+
+    def get_changed_metrics(self, previous: Mapping[str, Any], current: Mapping[str, Any]) -> Dict[str, Any]:
+        """Return the fields of current that moved beyond their threshold since previous"""
+        changed = {}
+        for key, value in current.items():
+            if key not in previous:
+                changed[key] = value
+                continue
+            old_value = previous[key]
+            threshold = self.change_thresholds.get(key)
+            if threshold is not None and isinstance(value, (int, float)) and isinstance(old_value, (int, float)):
+                if abs(value - old_value) >= threshold:
+                    changed[key] = value
+            elif value != old_value:
+                changed[key] = value
+        return changed
 
     def reset_fps_counter(self):
         """Reset FPS counter"""
-        self.frame_count = 0
-        self.last_fps_update = time.time()
+        with self._frame_lock:
+            self.frame_count = 0
+            self.last_fps_update = time.time()